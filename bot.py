@@ -3,7 +3,13 @@ import os
 import random
 import sys
 import asyncio
+import collections
 import datetime
+import dataclasses
+import json
+import logging
+import logging.handlers
+import queue
 from discord.commands import SlashCommandGroup # For grouping if needed later
 from discord.ext import commands # Still potentially useful, keep import
 from dotenv import load_dotenv
@@ -11,10 +17,33 @@ from dotenv import load_dotenv
 # --- Configuration ---
 load_dotenv()
 DISCORD_TOKEN = os.getenv('DISCORD_BOT_TOKEN')
+BOT_OWNER_ID = os.getenv('BOT_OWNER_ID') # Optional, saves fetching application info for owner checks
+CHECKPOINT_FILE = 'checkpoints.json' # channel ID -> newest message ID already cleaned by /delete_pings
+SENT_MESSAGES_FILE = 'sent_messages.json' # IDs of the messages the bot has sent, so /delete_pings can skip the history scan
 
 if not DISCORD_TOKEN:
     print("CRITICAL ERROR: DISCORD_BOT_TOKEN environment variable not found.")
     sys.exit("Bot token is missing. Please set the DISCORD_BOT_TOKEN environment variable.")
+if BOT_OWNER_ID and not BOT_OWNER_ID.isdigit():
+    sys.exit("BOT_OWNER_ID must be a Discord user ID.")
+
+# --- Logging ---
+# Records go through a queue and get formatted and written to stdout by a listener thread, so logging never blocks the event loop
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that queues records as-is, leaving message and traceback formatting to the listener thread."""
+    def prepare(self, record):
+        # The stock prepare() formats the record (traceback included) on the logging thread first
+        return record
+
+log = logging.getLogger('atsomeone')
+log.setLevel(logging.INFO)
+log.propagate = False
+_log_queue = queue.Queue(-1)
+log.addHandler(_DeferredQueueHandler(_log_queue))
+_log_stream = logging.StreamHandler(sys.stdout)
+_log_stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream)
+_log_listener.start()
 
 # --- Intents Setup ---
 intents = discord.Intents.default()
@@ -24,77 +53,185 @@ intents.presences = True       # To check if members are online/idle/dnd
 # Message history is needed for the delete command
 intents.messages = True # Redundant with default usually, but explicit
 
+# --- Event Loop ---
+# uvloop is a faster drop-in event loop (not available on Windows). The policy has to be set before
+# discord.Bot is created, since the bot grabs its loop at construction.
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass # Fall back to the default asyncio loop
+
+# Presence is built once and sent with the gateway IDENTIFY, so reconnects don't need a separate change_presence()
+WATCHING_ACTIVITY = discord.Activity(type=discord.ActivityType.watching, name="for pings")
+
 # Use discord.Bot
-bot = discord.Bot(intents=intents)
+# With owner_id set, bot.is_owner() is a plain ID compare. Otherwise it fetches application info once and caches the owner.
+bot = discord.Bot(intents=intents, owner_id=int(BOT_OWNER_ID) if BOT_OWNER_ID else None, status=discord.Status.idle, activity=WATCHING_ACTIVITY)
 
 # --- Global Variable ---
-bot_owner_id = None # Will be set in on_ready
+_bot_user_id = None # bot.user.id, cached in on_ready so the hot paths skip the property lookup
+_eligible_by_guild = {} # guild ID -> set of non-bot member IDs, kept up to date by the member events
+_eligible_tuples = {} # guild ID -> tuple snapshot of _eligible_by_guild to sample from, dropped whenever the set changes
+_visible_by_guild = {} # guild ID -> {channel ID -> tuple of eligible member IDs that can see it}, only filled by the slow path
+_checkpoints = {} # channel ID -> deletion checkpoint, loaded once at startup and shared by every /delete_pings run
+_save_lock = asyncio.Lock() # Serializes the background saves of the checkpoint and sent message files
+_sent_messages = collections.defaultdict(set) # channel ID -> IDs of the bot's messages there (see load_sent_messages)
+_sent_index_since = None # Snowflake from which _sent_messages is complete, None until loaded
+_deletion_tasks = {} # guild ID -> running /delete_pings task (also keeps the task referenced until it finishes)
 
 # --- Helper Functions ---
-async def check_delete_perms(interaction: discord.Interaction):
-    """Checks if user is owner or has Manage Messages permission."""
-    if not interaction.guild: # Command must be used in a server
-        # Check if response already sent before sending error (e.g. if check is called after defer)
-        if not interaction.response.is_done():
-            await interaction.response.send_message("This command can only be used in a server.", ephemeral=True)
-        else:
-            await interaction.followup.send("This command can only be used in a server.", ephemeral=True)
-        return False
+def _eligible_ids(guild: discord.Guild):
+    """Returns the cached set of non-bot member IDs for a guild, building it on first use."""
+    ids = _eligible_by_guild.get(guild.id)
+    if ids is None:
+        ids = _eligible_by_guild[guild.id] = {m.id for m in guild.members if not m.bot}
+    return ids
+
+def _eligible_tuple(guild: discord.Guild):
+    """Returns the guild's eligible member IDs as a tuple for sampling, reused until the members change."""
+    ids = _eligible_tuples.get(guild.id)
+    if ids is None:
+        ids = _eligible_tuples[guild.id] = tuple(_eligible_ids(guild))
+    return ids
+
+def _forget_eligible(guild_id: int):
+    """Drops the cached tuples after the guild's eligible members (or who can see which channel) changed."""
+    _eligible_tuples.pop(guild_id, None)
+    _visible_by_guild.pop(guild_id, None)
+
+def pick_random_member(channel: discord.TextChannel, exclude_id: int, attempts: int = 25):
+    """Picks a random non-bot member who can see the channel, or None if there isn't one."""
+    # Shared between mentions, so the excluded member is skipped when picked instead of copying the pool
+    candidates = _eligible_tuple(channel.guild)
+    channels = _visible_by_guild.setdefault(channel.guild.id, {})
+    visible = channels.get(channel.id)
+    if visible is None:
+        # Most members can usually see the channel, so sample first and only check permissions for the picks
+        for _ in range(min(attempts, len(candidates))):
+            member_id = random.choice(candidates)
+            if member_id == exclude_id:
+                continue
+            member = channel.guild.get_member(member_id)
+            if member and channel.permissions_for(member).read_messages:
+                return member
+        # Unlucky (or a private channel): fall back to checking everyone, and keep the result so later mentions
+        # here skip the sampling, the permissions only change with the member, role and channel events that drop it
+        visible = channels[channel.id] = tuple(
+            m.id for m in map(channel.guild.get_member, candidates) if m and channel.permissions_for(m).read_messages
+        )
+    member_id = random.choice(visible) if visible else None
+    if member_id == exclude_id: # Redraw from everyone else, rare enough that building the list is fine
+        others = [i for i in visible if i != exclude_id]
+        member_id = random.choice(others) if others else None
+    return channel.guild.get_member(member_id) if member_id else None
+
+async def _try_send(send, content: str, what: str, **kwargs):
+    """Best-effort send(content, **kwargs): logs a failure (describing the message as `what`) instead of raising. Returns the sent message or None."""
+    try:
+        sent = await send(content, **kwargs)
+        _track_sent(sent) # Even delete_after ones, the delete is lost if the bot stops before it runs
+        if kwargs.get('delete_after') is not None:
+            # Forget it again once the auto-delete has run, so only IDs orphaned by a crash stay in the index
+            asyncio.get_running_loop().call_later(kwargs['delete_after'], _sent_messages[sent.channel.id].discard, sent.id)
+        return sent
+    except discord.Forbidden:
+        log.error(f"Missing permissions to send {what}")
+    except Exception as e:
+        log.error(f"Failed to send {what}: {e}")
+    return None
 
-    # Ensure owner ID is loaded
-    global bot_owner_id
-    if bot_owner_id is None:
+async def respond(interaction: discord.Interaction, msg: str, *, ephemeral: bool = True):
+    """Sends msg as the interaction response, or as a followup if it was already responded to/deferred."""
+    send = interaction.followup.send if interaction.response.is_done() else interaction.response.send_message
+    try:
+        await send(msg, ephemeral=ephemeral)
+    except discord.InteractionResponded: # Responded between the check and the send
         try:
-            app_info = await bot.application_info()
-            bot_owner_id = app_info.owner.id
-            print(f"(Re-fetched Owner ID for perm check: {bot_owner_id})")
+            await interaction.followup.send(msg, ephemeral=ephemeral)
         except Exception as e:
-            print(f"!!! ERROR: Could not verify owner ID during perm check: {e}")
-            if not interaction.response.is_done():
-                await interaction.response.send_message("Error: Could not verify owner ID for permissions check.", ephemeral=True)
-            else:
-                await interaction.followup.send("Error: Could not verify owner ID for permissions check.", ephemeral=True)
-            return False
-
-    # Check if invoker is the bot owner
-    if interaction.user.id == bot_owner_id:
-        return True
-
-    # Check if invoker has 'Manage Messages' permission in the server
-    # Use guild_permissions as interaction might not have member context initially in some cases
-    if interaction.user.guild_permissions.manage_messages:
-        return True
-
-    # If neither, deny permission
-    if not interaction.response.is_done():
-        await interaction.response.send_message("You need the 'Manage Messages' permission or be the bot owner to use this command.", ephemeral=True)
-    else:
-        await interaction.followup.send("You need the 'Manage Messages' permission or be the bot owner to use this command.", ephemeral=True)
-    return False
+            log.error(f"Failed to send followup message after race condition: {e}")
+    except Exception as e:
+        log.error(f"Failed to send interaction response: {e}")
+
+def _track_sent(message: discord.Message):
+    """Records a message the bot sent in the sent message index."""
+    _sent_messages[message.channel.id].add(message.id)
+
+async def owner_or_manage_messages(ctx: discord.ApplicationContext):
+    """Command check: passes for the bot owner or anyone with Manage Messages in the server (guild-only commands)."""
+    # guild_permissions as the interaction might not have member context initially in some cases
+    return ctx.author.guild_permissions.manage_messages or await bot.is_owner(ctx.author)
 
 
 # --- Events ---
 @bot.event
 async def on_ready():
     """Runs once when the bot connects and is ready."""
-    global bot_owner_id
-    # Clear previous owner ID in case of reconnect/reload
-    bot_owner_id = None
-    print(f'Logged in as {bot.user.name} ({bot.user.id})')
-    print(f'Library Version: {discord.__version__}')
-    print('Fetching owner information...')
-    try:
-        app_info = await bot.application_info()
-        bot_owner_id = app_info.owner.id
-        print(f"Successfully fetched Owner ID: {bot_owner_id} ({app_info.owner.name})")
-    except Exception as e:
-        print(f"!!! WARNING: Could not fetch owner ID: {e}")
-        print("!!! The /shutdownserver and /delete_pings owner checks may not work correctly initially.")
+    global _bot_user_id
+    _bot_user_id = bot.user.id
+    log.info(f'Logged in as {bot.user.name} ({_bot_user_id})')
+    log.info(f'Library Version: {discord.__version__}')
+    if not bot.owner_id and not bot.owner_ids:
+        # No BOT_OWNER_ID and not looked up yet (kept across reconnects): is_owner() fetches
+        # application info and caches the owner, so commands never pay for the round-trip
+        log.info('BOT_OWNER_ID not set, fetching owner information...')
+        try:
+            await bot.is_owner(bot.user)
+            log.info(f"Successfully fetched Owner ID(s): {bot.owner_id or bot.owner_ids}")
+        except Exception as e:
+            log.warning(f"Could not fetch owner information, it will be retried on the first owner check: {e}")
+
+    log.info('Bot is ready and listening for mentions!')
+    log.info('------')
+
+    # (Re)build the eligible member caches, the member events keep them current from here
+    _eligible_by_guild.clear()
+    _eligible_tuples.clear()
+    _visible_by_guild.clear()
+    for guild in bot.guilds:
+        _eligible_ids(guild)
+
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    _eligible_ids(guild)
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    _eligible_by_guild.pop(guild.id, None)
+    _forget_eligible(guild.id)
+
+@bot.event
+async def on_member_join(member: discord.Member):
+    if not member.bot and member.guild.id in _eligible_by_guild:
+        _eligible_by_guild[member.guild.id].add(member.id)
+        _forget_eligible(member.guild.id)
+
+@bot.event
+async def on_member_remove(member: discord.Member):
+    if member.guild.id in _eligible_by_guild:
+        _eligible_by_guild[member.guild.id].discard(member.id)
+        _forget_eligible(member.guild.id)
 
-    print('Bot is ready and listening for mentions!')
-    print('------')
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    if before.roles != after.roles: # Can change which channels they see
+        _visible_by_guild.pop(after.guild.id, None)
 
-    await bot.change_presence(status=discord.Status.idle, activity=discord.Activity(type=discord.ActivityType.watching, name="for pings"))
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    if before.permissions != after.permissions:
+        _visible_by_guild.pop(after.guild.id, None)
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    # Members lose the role without an on_member_update, and with it any channel it gave them
+    _visible_by_guild.pop(role.guild.id, None)
+
+@bot.event
+async def on_guild_channel_update(before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+    if before.overwrites != after.overwrites:
+        _visible_by_guild.pop(after.guild.id, None)
 
 @bot.event
 async def on_message(message: discord.Message):
@@ -105,265 +242,346 @@ async def on_message(message: discord.Message):
         return
 
     # 2. Check if the bot itself was mentioned
-    if bot.user in message.mentions:
+    # raw_mentions is just the IDs parsed from the content, no User objects get resolved
+    if _bot_user_id in message.raw_mentions:
 
-        print(f"Bot mentioned by {message.author} in #{message.channel.name} (Server: {message.guild.name})")
+        log.info(f"Bot mentioned by {message.author} in #{message.channel.name} (Server: {message.guild.name})")
 
         # 3. Ensure it's in a server text channel (not a DM)
         if not message.guild or not isinstance(message.channel, discord.TextChannel):
-            print(f"Ignoring bot mention from DM or non-text channel by {message.author}")
+            log.info(f"Ignoring bot mention from DM or non-text channel by {message.author}")
             return
 
-        # 4. Get potential members to mention (excluding the bot and the author)
-        eligible_members = []
+        # 4. Pick a member to mention (excluding bots and the author)
+        # Every status (offline included) is allowed, so presence updates don't change who's eligible
         try:
-            for member in message.channel.members:
-                if (not member.bot and
-                    member != message.author and
-                    member.status in [discord.Status.online, discord.Status.idle, discord.Status.dnd, discord.Status.offline]):
-                    eligible_members.append(member)
+            chosen_member = pick_random_member(message.channel, message.author.id)
         except Exception as e:
-            print(f"Error retrieving members in '{message.channel.name}': {e}")
-            try:
-                await message.reply(f"Sorry {message.author.mention}, I had trouble getting the member list for this channel.", mention_author=False, delete_after=15)
-            except discord.Forbidden: pass
+            log.error(f"Error retrieving members in '{message.channel.name}': {e}")
+            await _try_send(message.reply, f"Sorry {message.author.mention}, I had trouble getting the member list for this channel.", f"'member list' reply in #{message.channel.name}", mention_author=False, delete_after=15)
             return
 
-        # 5. If eligible members exist, send reply in main channel
-        if eligible_members:
-            chosen_member = random.choice(eligible_members)
+        # 5. If an eligible member was found, send reply in main channel
+        if chosen_member:
             reply_content = f"{chosen_member.mention}" # Just the ping
             try:
                 # Reply to the original message, DO NOT ping the original author.
-                await message.reply(reply_content, mention_author=False)
-                print(f"Replied to mention from {message.author}. Pinged: {chosen_member}")
+                _track_sent(await message.reply(reply_content, mention_author=False))
+                log.info(f"Replied to mention from {message.author}. Pinged: {chosen_member}")
             except discord.Forbidden:
-                print(f"ERROR: Missing permissions to send reply in #{message.channel.name} on server '{message.guild.name}'")
-                try:
-                    await message.channel.send(f"Sorry {message.author.mention}, I couldn't reply here (missing permissions).", delete_after=15)
-                except discord.Forbidden: pass
+                log.error(f"Missing permissions to send reply in #{message.channel.name} on server '{message.guild.name}'")
+                await _try_send(message.channel.send, f"Sorry {message.author.mention}, I couldn't reply here (missing permissions).", f"'missing permissions' message in #{message.channel.name}", delete_after=15)
             except Exception as e:
-                print(f"ERROR: Failed to send mention reply: {e}")
+                log.error(f"Failed to send mention reply: {e}")
         else:
             # No eligible members found
-            print(f"No eligible online users found to ping for mention by {message.author} in #{message.channel.name}")
-            try:
-                 await message.reply(f"Sorry {message.author.mention}, couldn't find anyone online and eligible to ping right now!", mention_author=False, delete_after=15)
-            except discord.Forbidden:
-                 print(f"ERROR: Missing permissions to send 'not found' reply in #{message.channel.name}")
-            except Exception as e:
-                 print(f"ERROR: Failed to send 'not found' reply: {e}")
+            log.info(f"No eligible online users found to ping for mention by {message.author} in #{message.channel.name}")
+            await _try_send(message.reply, f"Sorry {message.author.mention}, couldn't find anyone online and eligible to ping right now!", f"'not found' reply in #{message.channel.name}", mention_author=False, delete_after=15)
 
 
-# --- Slash Commands ---
+# --- Deletion Helpers ---
+DELETE_PERMISSIONS = discord.Permissions(read_message_history=True, manage_messages=True) # Needed per channel, checked as one bitmask
 
-@bot.slash_command(name="delete_pings", description="[Owner/Manage Messages] Deletes all messages sent by this bot in this server.")
-async def delete_pings(interaction: discord.Interaction):
-    """Deletes all messages sent by the bot in the current guild."""
-    print(f"'/delete_pings' invoked by {interaction.user} ({interaction.user.id}) in server '{interaction.guild.name}' ({interaction.guild.id})")
+@dataclasses.dataclass(slots=True)
+class DeletionStats:
+    """Deleted/failed message counts, kept per channel scan and summed into the totals for the run."""
+    deleted: int = 0
+    failed: int = 0
 
-    # Defer response first, before permission check, as check might take time if owner ID needs fetching
-    await interaction.response.defer(ephemeral=True)
-    print("Interaction deferred.")
+    def add(self, other: "DeletionStats"):
+        self.deleted += other.deleted
+        self.failed += other.failed
 
-    # 1. Check Permissions (Owner or Manage Messages)
-    if not await check_delete_perms(interaction):
-        # check_delete_perms sends the denial message via followup now
-        print("Permission check failed for /delete_pings.")
-        return
-
-    # 2. Initialize counters
-    deleted_count = 0
-    failed_count = 0
-    start_time = datetime.datetime.now(datetime.timezone.utc)
-    fourteen_days_ago = start_time - datetime.timedelta(days=14)
+def load_checkpoints():
+    """Loads the per-channel deletion checkpoints (empty if the file is missing or unreadable)."""
+    try:
+        with open(CHECKPOINT_FILE) as f:
+            return {int(k): v for k, v in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        log.warning(f"Could not read {CHECKPOINT_FILE}, scanning full history: {e}")
+        return {}
+
+def load_sent_messages():
+    """Loads the sent message index, returning (since, index). Every message the bot sent after `since` is in the index."""
+    now = discord.utils.time_snowflake(datetime.datetime.now(datetime.timezone.utc))
+    try:
+        with open(SENT_MESSAGES_FILE) as f:
+            data = json.load(f)
+        index = collections.defaultdict(set, {int(k): set(v) for k, v in data["channels"].items()})
+        if data.get("clean"):
+            return data["since"], index
+        # The last process died without saving, so whatever it sent since the previous save is missing.
+        # Only trust the index from now on, every channel gets one more history scan before it takes over.
+        log.warning(f"{SENT_MESSAGES_FILE} was not saved on a clean shutdown, it will only be trusted for new messages")
+        return now, index
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError) as e:
+        log.warning(f"Could not read {SENT_MESSAGES_FILE}, starting a new index: {e}")
+    # Nothing before now is indexed, so every channel gets one more history scan before the index takes over
+    return now, collections.defaultdict(set)
+
+def _write_json(path: str, data):
+    """Writes data as JSON through a temp file, so a crash mid-write can't leave a truncated file behind."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def save_sent_messages(clean: bool = False, index: dict = None):
+    """Writes the sent message index (or a snapshot of it) back to disk. Only the save on shutdown marks it clean (complete)."""
+    index = _sent_messages if index is None else index
+    try:
+        _write_json(SENT_MESSAGES_FILE, {"since": _sent_index_since, "clean": clean, "channels": {k: sorted(v) for k, v in index.items() if v}})
+    except OSError as e:
+        log.warning(f"Could not save {SENT_MESSAGES_FILE}: {e}")
 
-    # 3. Iterate through all text channels the bot can see
-    print(f"Starting message deletion scan in server '{interaction.guild.name}'...")
-    if not interaction.guild: # Should be caught by check_delete_perms, but safety check
-        await interaction.followup.send("Error: Guild context lost.", ephemeral=True)
+def save_checkpoints(checkpoints: dict):
+    """Writes the per-channel deletion checkpoints back to disk."""
+    try:
+        _write_json(CHECKPOINT_FILE, checkpoints)
+    except OSError as e:
+        log.warning(f"Could not save {CHECKPOINT_FILE}: {e}")
+
+async def save_deletion_state():
+    """Saves the checkpoints and the sent message index from a worker thread, so the dumps don't block the event loop."""
+    async with _save_lock: # One writer at a time, each writing the latest snapshot
+        checkpoints = dict(_checkpoints)
+        index = {k: tuple(v) for k, v in _sent_messages.items() if v}
+        await asyncio.to_thread(save_checkpoints, checkpoints)
+        await asyncio.to_thread(save_sent_messages, False, index)
+
+async def _with_backoff(channel: discord.TextChannel, func, *args, max_attempts: int = 3):
+    """Awaits func(*args), backing off only if Discord still answers with a 429."""
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return await func(*args)
+        except discord.HTTPException as e:
+            if e.status != 429 or attempt == max_attempts:
+                raise
+            retry_after = float(e.response.headers.get('Retry-After', 5))
+            log.warning(f"  [#{channel.name}] Rate limited, retrying in {retry_after}s (attempt {attempt}/{max_attempts})...")
+            await asyncio.sleep(retry_after)
+
+async def _drain_singles(channel: discord.TextChannel, singles: asyncio.Queue, stats: DeletionStats):
+    """Deletes queued messages one at a time until cancelled (for messages too old to bulk delete)."""
+    # Several of these share one queue, which is what bounds the number of concurrent deletes
+    while True:
+        message = await singles.get()
+        try:
+            await _with_backoff(channel, message.delete)
+            stats.deleted += 1
+            _sent_messages[channel.id].discard(message.id)
+        except discord.NotFound:
+            _sent_messages[channel.id].discard(message.id) # Already gone
+        except discord.HTTPException as e:
+            log.error(f"  [#{channel.name}] Failed single delete {message.id}: {e}")
+            stats.failed += 1
+        except Exception as e:
+            # Connection errors, timeouts etc. must not kill the worker, or nothing drains the queue and the scan hangs
+            log.error(f"  [#{channel.name}] Unexpected error during single delete {message.id}: {e}")
+            stats.failed += 1
+        finally:
+            singles.task_done()
+
+async def _bulk_delete(channel: discord.TextChannel, batch: list, singles: asyncio.Queue, stats: DeletionStats):
+    """Bulk deletes a batch of up to 100 messages, handing them to the single delete queue if that fails."""
+    try:
+        await _with_backoff(channel, channel.delete_messages, batch)
+        stats.deleted += len(batch)
+        _sent_messages[channel.id].difference_update(m.id for m in batch)
+    except discord.HTTPException as e:
+        log.error(f"  [#{channel.name}] Error bulk deleting chunk: {e}. Adding to single delete queue.")
+        for message in batch:
+            await singles.put(message)
+    except Exception as e:
+        # Connection errors, timeouts etc.: retry one by one rather than abandoning the channel
+        log.error(f"  [#{channel.name}] Unexpected error during bulk delete: {e}. Adding to single delete queue.")
+        for message in batch:
+            await singles.put(message)
+
+def _index_covers(after_id: int):
+    """True if the sent message index has every bot message in a channel newer than the checkpoint after_id."""
+    # Past the checkpoint everything has been cleaned, and from _sent_index_since on everything is indexed,
+    # so a checkpoint at or after that point means the index is complete and no history needs fetching.
+    return bool(_sent_index_since and after_id and after_id >= _sent_index_since)
+
+async def _bot_messages(channel: discord.TextChannel, bot_user_id: int, after_id: int = None):
+    """Yields the bot's messages in a channel newer than after_id, from the sent message index if it covers them."""
+    # Yields PartialMessages (just the IDs), deleting never needs the content, embeds etc. of a full Message
+    if _index_covers(after_id):
+        for message_id in sorted(_sent_messages.get(channel.id, ())):
+            yield channel.get_partial_message(message_id)
+    else:
+        history = channel.history(limit=None, after=discord.Object(id=after_id) if after_id else None)
+        async for message in history.filter(lambda m: m.author.id == bot_user_id):
+            yield channel.get_partial_message(message.id)
+
+async def _scan_channel(channel: discord.TextChannel, bot_member: discord.Member, sem: asyncio.Semaphore, counters: DeletionStats, checkpoints: dict):
+    """Deletes the bot's messages in a single channel, adding totals to the shared counters and advancing its checkpoint."""
+    # Only messages after the last checkpoint are scanned, so repeat runs don't redo old history.
+    newest_id = channel.last_message_id # Grab before scanning so anything sent mid-scan is picked up next run
+    after_id = checkpoints.get(channel.id)
+
+    # Skip without touching the API if nothing was posted since the last clean run,
+    # or the sent message index says the bot hasn't posted here since then
+    if after_id and ((newest_id and newest_id <= after_id) or (_index_covers(after_id) and not _sent_messages.get(channel.id))):
+        if newest_id and newest_id > after_id:
+            checkpoints[channel.id] = newest_id
         return
 
-    for channel in interaction.guild.text_channels:
-        # Reset lists for each channel
-        messages_to_delete_bulk = []
-        messages_to_delete_single = []
-        channel_deleted_count = 0
-        channel_failed_count = 0
-        processed_count = 0 # Counter for progress logging
-
-        print(f"Scanning channel: #{channel.name} ({channel.id})")
+    # Only a limited number of channels are scanned at once (see delete_pings)
+    async with sem:
+        log.info(f"Scanning channel: #{channel.name} ({channel.id})")
+        stats = DeletionStats()
         try:
             # Check if bot has Read Message History and Manage Messages in *this specific channel*
-            # Use guild.me as interaction.guild.me might not be available if context is lost somehow
-            bot_member = interaction.guild.get_member(bot.user.id)
-            if not bot_member:
-                 print(f"Skipping channel #{channel.name} - Could not get bot member object.")
-                 continue
-            bot_perms = channel.permissions_for(bot_member)
-            if not bot_perms.read_message_history or not bot_perms.manage_messages:
-                print(f"Skipping channel #{channel.name} - Missing Read History or Manage Messages permission.")
-                continue
-
-            # --- !!! MEMORY SAFE HISTORY ITERATION START !!! ---
-            # Iterate through history more carefully, fetching in chunks implicitly
-            # No limit=None to avoid loading everything into memory
-            async for message in channel.history(limit=5000): # Process history (adjust limit if needed, None IS dangerous)
-                processed_count += 1
-                if processed_count % 500 == 0: # Log progress occasionally
-                    print(f"  [#{channel.name}] Scanned {processed_count} messages...")
-
-                # Check if message is from the bot
-                if message.author.id == bot.user.id: # Safer check using ID
-                    if message.created_at > fourteen_days_ago:
-                        messages_to_delete_bulk.append(message)
+            if not channel.permissions_for(bot_member).is_superset(DELETE_PERMISSIONS):
+                log.warning(f"Skipping channel #{channel.name} - Missing Read History or Manage Messages permission.")
+                return
+
+            # Snowflakes grow with creation time, so comparing IDs against this one tells the ages apart
+            # without turning every message's timestamp into a datetime
+            bulk_cutoff_id = discord.utils.time_snowflake(datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=14))
+
+            # Messages younger than 14 days are bulk deleted 100 at a time. Older ones go through a small
+            # bounded queue that a few background tasks drain while we keep going, so nothing piles up in
+            # memory and single delete latency overlaps with the history fetches.
+            # No fixed sleeps here: the library's HTTP client already waits on the rate limit buckets,
+            # the drainers just keep up to 5 deletes in flight so the bucket's burst allowance gets used.
+            singles = asyncio.Queue(maxsize=50)
+            drain_tasks = [asyncio.create_task(_drain_singles(channel, singles, stats)) for _ in range(5)]
+            try:
+                batch = []
+                async for message in _bot_messages(channel, bot_member.id, after_id):
+                    if message.id > bulk_cutoff_id:
+                        batch.append(message)
+                        if len(batch) == 100:
+                            await _bulk_delete(channel, batch, singles, stats)
+                            batch = []
                     else:
-                        messages_to_delete_single.append(message)
-
-                    # --- Process deletes periodically to avoid large lists in memory ---
-                    if len(messages_to_delete_bulk) >= 99: # Keep slightly under 100 limit just in case
-                         try:
-                            await channel.delete_messages(messages_to_delete_bulk)
-                            print(f"  [#{channel.name}] Bulk deleted {len(messages_to_delete_bulk)} messages.")
-                            deleted_count += len(messages_to_delete_bulk)
-                            channel_deleted_count += len(messages_to_delete_bulk)
-                            messages_to_delete_bulk = [] # Clear the list
-                            await asyncio.sleep(1) # Sleep after bulk delete
-                         except discord.Forbidden:
-                             print(f"  [#{channel.name}] ERROR: Permission denied during periodic bulk delete. Adding to single queue.")
-                             messages_to_delete_single.extend(messages_to_delete_bulk)
-                             messages_to_delete_bulk = []
-                         except discord.HTTPException as bulk_e:
-                             print(f"  [#{channel.name}] Error bulk deleting chunk: {bulk_e}. Adding to single delete queue.")
-                             messages_to_delete_single.extend(messages_to_delete_bulk)
-                             messages_to_delete_bulk = [] # Still clear list
-                         except Exception as e:
-                             print(f"  [#{channel.name}] Unexpected error during periodic bulk delete: {e}. Adding to single queue.")
-                             messages_to_delete_single.extend(messages_to_delete_bulk)
-                             messages_to_delete_bulk = []
-
-
-            print(f"  [#{channel.name}] Finished initial history scan ({processed_count} messages). Processing remaining deletes...")
-            # --- !!! MEMORY SAFE HISTORY ITERATION END !!! ---
-
-
-            # --- Process remaining messages (bulk < 14d, single > 14d or failed) ---
-            # Bulk delete any remaining messages younger than 14 days
-            if messages_to_delete_bulk:
-                 # Split into chunks of 100
-                 for i in range(0, len(messages_to_delete_bulk), 99): # Use 99 again
-                    chunk = messages_to_delete_bulk[i:i+99]
-                    if chunk:
-                        try:
-                            await channel.delete_messages(chunk)
-                            deleted_count += len(chunk)
-                            channel_deleted_count += len(chunk)
-                            print(f"  [#{channel.name}] Bulk deleted remaining {len(chunk)} messages")
-                            await asyncio.sleep(1)
-                        except discord.Forbidden:
-                             print(f"  [#{channel.name}] ERROR: Permission denied during final bulk delete. Skipping chunk.")
-                             failed_count += len(chunk); channel_failed_count += len(chunk)
-                        except discord.HTTPException as e:
-                            print(f"  [#{channel.name}] Failed to bulk delete remaining chunk: {e}. Trying single delete.")
-                            messages_to_delete_single.extend(chunk) # Add failed ones to single delete
-                        except Exception as e:
-                            print(f"  [#{channel.name}] Unexpected error during final bulk delete: {e}. Trying single delete.")
-                            messages_to_delete_single.extend(chunk)
-
-
-            # Delete messages older than 14 days (or failed bulk ones) one by one
-            print(f"  [#{channel.name}] Processing {len(messages_to_delete_single)} messages for single delete...")
-            for msg_to_delete in messages_to_delete_single:
-                try:
-                    await msg_to_delete.delete()
-                    deleted_count += 1
-                    channel_deleted_count += 1
-                    await asyncio.sleep(1.5) # Sleep between single deletes
-                except discord.Forbidden:
-                    print(f"  [#{channel.name}] Failed single delete {msg_to_delete.id} (Forbidden).")
-                    failed_count += 1; channel_failed_count += 1
-                except discord.NotFound:
-                    print(f"  [#{channel.name}] Failed single delete {msg_to_delete.id} (NotFound).")
-                except discord.HTTPException as e:
-                    print(f"  [#{channel.name}] Failed single delete {msg_to_delete.id} (HTTPException: {e}).")
-                    failed_count += 1; channel_failed_count += 1
-                    await asyncio.sleep(5) # Back off longer
-                except Exception as e:
-                     print(f"  [#{channel.name}] Unexpected error during single delete {msg_to_delete.id}: {e}")
-                     failed_count += 1; channel_failed_count += 1
-
+                        await singles.put(message)
+                if batch:
+                    await _bulk_delete(channel, batch, singles, stats)
+                await singles.join()
+            finally:
+                for task in drain_tasks:
+                    task.cancel()
+
+            if newest_id and not stats.failed:
+                checkpoints[channel.id] = newest_id # Only advanced on success, failed channels are rescanned
+            if stats.deleted or stats.failed:
+                log.info(f"Finished channel #{channel.name}: Deleted={stats.deleted}, Failed={stats.failed}")
 
         except discord.Forbidden:
-            print(f"Skipping channel #{channel.name} - Permission denied accessing history.")
+            log.warning(f"Skipping channel #{channel.name} - Permission denied accessing history or deleting messages.")
+        except discord.HTTPException as e:
+            log.error(f"  [#{channel.name}] Failed to scan messages: {e}")
+            stats.failed += 1
         except Exception as e:
-            print(f"An unexpected error occurred processing channel #{channel.name}: {e}")
-            import traceback
-            traceback.print_exc() # Print full traceback for unexpected errors
+            # Full traceback for unexpected errors, formatted on the log listener thread
+            log.exception(f"An unexpected error occurred processing channel #{channel.name}: {e}")
+            stats.failed += 1
+        finally:
+            counters.add(stats)
+
+
+async def _run_deletion(guild: discord.Guild, bot_member: discord.Member, report_channel, user):
+    """Runs a full deletion scan of the guild and reports the totals in report_channel."""
+    # 1. Initialize counters (shared by all channel scans)
+    counters = DeletionStats()
+    start_time = datetime.datetime.now(datetime.timezone.utc)
 
-        if channel_deleted_count > 0 or channel_failed_count > 0:
-             print(f"Finished channel #{channel.name}: Deleted={channel_deleted_count}, Failed={channel_failed_count}")
+    # 2. Iterate through all text channels the bot can see
+    log.info(f"Starting message deletion scan in server '{guild.name}'...")
+    # Scan channels concurrently, but cap how many are in flight so we don't hammer the rate limits
+    # The task group cancels any scans still running if this task is cancelled (e.g. on shutdown)
+    sem = asyncio.Semaphore(8)
+    try:
+        async with asyncio.TaskGroup() as tg:
+            for channel in guild.text_channels:
+                tg.create_task(_scan_channel(channel, bot_member, sem, counters, _checkpoints))
+    finally:
+        # Keep the channels that did finish, interrupted ones are rescanned next run. The shared dict
+        # also holds the progress of runs still going in other servers, so nothing gets overwritten.
+        await save_deletion_state()
 
-    # 5. Send final report
+    # 3. Send final report
+    # Posted in the channel rather than as a followup, the interaction token expires after 15 minutes
     duration = datetime.datetime.now(datetime.timezone.utc) - start_time
-    print(f"Deletion process completed in {duration}. Total Deleted: {deleted_count}, Total Failed: {failed_count}")
+    deleted_count = counters.deleted
+    failed_count = counters.failed
+    log.info(f"Deletion process completed in {duration}. Total Deleted: {deleted_count}, Total Failed: {failed_count}")
     try:
-        await interaction.followup.send(f"Deletion scan complete!\nDeleted approx: {deleted_count} messages.\nFailed/Skipped approx: {failed_count} messages.\nTime taken: {duration}", ephemeral=True)
-    except Exception as followup_e:
-        print(f"Error sending followup message: {followup_e}")
+        report = await report_channel.send(f"{user.mention} Deletion scan complete!\nDeleted approx: {deleted_count} messages.\nFailed/Skipped approx: {failed_count} messages.\nTime taken: {duration}", allowed_mentions=discord.AllowedMentions(users=[user]))
+        _track_sent(report)
+    except Exception as report_e:
+        log.error(f"Error sending deletion report: {report_e}")
+
+
+# --- Slash Commands ---
+
+@bot.slash_command(name="delete_pings", description="[Owner/Manage Messages] Deletes all messages sent by this bot in this server.")
+@discord.guild_only() # Not offered in DMs at all
+@commands.check(owner_or_manage_messages) # Runs before the command, failures go to on_application_command_error
+async def delete_pings(interaction: discord.Interaction):
+    """Starts deleting all messages sent by the bot in the current guild in the background."""
+    log.info(f"'/delete_pings' invoked by {interaction.user} ({interaction.user.id}) in server '{interaction.guild.name}' ({interaction.guild.id})")
+
+    running = _deletion_tasks.get(interaction.guild.id)
+    if running and not running.done():
+        await respond(interaction, "A deletion scan is already running in this server.")
+        return
+
+    # Looked up once here, only the permissions need to be checked per channel
+    # Fall back to get_member as guild.me might not be available if context is lost somehow
+    bot_member = interaction.guild.me or interaction.guild.get_member(_bot_user_id)
+    if not bot_member:
+        log.error("Could not get bot member object, aborting deletion scan.")
+        await respond(interaction, "Error: Could not find my own member object in this server.")
+        return
+
+    # The scan can take far longer than an interaction stays valid, so answer now and run it as a task
+    await respond(interaction, "Deletion started in the background, I'll post in this channel when it's done.")
+    task = asyncio.create_task(_run_deletion(interaction.guild, bot_member, interaction.channel, interaction.user))
+    _deletion_tasks[interaction.guild.id] = task
+    task.add_done_callback(lambda t, guild_id=interaction.guild.id: _deletion_tasks.pop(guild_id, None))
 
 
 @bot.slash_command(name="shutdownserver", description="[Owner Only] Shuts down the bot process.")
 async def shutdown_command(interaction: discord.Interaction):
     """Handles the /shutdownserver command."""
-    # Add a print statement right at the start to confirm entry
-    print(f"'/shutdownserver' command received from {interaction.user} ({interaction.user.id})")
-
-    global bot_owner_id
+    # Log right at the start to confirm entry
+    log.info(f"'/shutdownserver' command received from {interaction.user} ({interaction.user.id})")
 
     # Defer might be needed if owner check takes time, but usually isn't. Send immediate response if possible.
     # await interaction.response.defer(ephemeral=True) # Generally avoid deferring here unless needed
 
-    # Double check owner ID if it failed on_ready
-    if bot_owner_id is None:
-        print("Owner ID is None, attempting to fetch...")
-        try:
-            app_info = await bot.application_info()
-            bot_owner_id = app_info.owner.id
-            print(f"(Re-fetched Owner ID: {bot_owner_id})")
-        except Exception as e:
-            print(f"!!! FATAL: Could not verify owner ID during shutdown command: {e}")
-            if not interaction.response.is_done():
-                 await interaction.response.send_message(
-                    "Error: Could not verify owner ID. Shutdown cannot proceed safely.", ephemeral=True
-                 )
-            else:
-                 await interaction.followup.send("Error: Could not verify owner ID. Shutdown cannot proceed safely.", ephemeral=True)
-            return
+    # Check if the user invoking is the bot owner (is_owner caches the owner after the first lookup)
+    try:
+        is_owner = await bot.is_owner(interaction.user)
+    except Exception as e:
+        log.critical(f"Could not verify owner ID during shutdown command: {e}")
+        await respond(interaction, "Error: Could not verify owner ID. Shutdown cannot proceed safely.")
+        return
 
-    # Check if the user invoking is the bot owner
-    if interaction.user.id == bot_owner_id:
-        print("Shutdown authorized by owner.")
+    if is_owner:
+        log.info("Shutdown authorized by owner.")
         # Respond before shutting down
-        if not interaction.response.is_done():
-            await interaction.response.send_message("Acknowledged. Shutting down the bot process...", ephemeral=True)
-        else:
-             # Should generally not be deferred, but handle just in case
-             await interaction.followup.send("Acknowledged. Shutting down the bot process...", ephemeral=True)
+        await respond(interaction, "Acknowledged. Shutting down the bot process...")
 
-
-        print("Closing connection and exiting script...")
+        log.info("Closing connection and exiting script...")
         await asyncio.sleep(1) # Give message time to send
         await bot.close()
         # sys.exit might not be the best way if run under certain managers,
         # letting bot.close() finish and the script end naturally is often better.
         # sys.exit("Bot shutdown initiated by owner via /shutdownserver command.")
-        print("Bot run loop should exit now.") # Let the main loop handle exit
+        log.info("Bot run loop should exit now.") # Let the main loop handle exit
     else:
-        print(f"Unauthorized shutdown attempt by {interaction.user}.")
-        if not interaction.response.is_done():
-             await interaction.response.send_message("Error: You do not have permission to use this command.", ephemeral=True)
-        else:
-             await interaction.followup.send("Error: You do not have permission to use this command.", ephemeral=True)
+        log.warning(f"Unauthorized shutdown attempt by {interaction.user}.")
+        await respond(interaction, "Error: You do not have permission to use this command.")
 
 
 # --- Error Handling ---
@@ -371,59 +589,49 @@ async def shutdown_command(interaction: discord.Interaction):
 async def on_application_command_error(interaction: discord.Interaction, error: discord.DiscordException):
     """Basic error handler for slash commands."""
     error_message = f"An error occurred with command '{interaction.command.name}': {error}"
-    print(f"ERROR: {error_message}")
-    import traceback
-    traceback.print_exc() # Print full traceback for debugging
 
     # Check specific errors if needed, e.g., CheckFailure for permission decorators
-    # Check if CheckFailure is part of discord.app_commands or discord.ext.commands
-    if isinstance(error, commands.CheckFailure) or isinstance(error, discord.app_commands.CheckFailure):
-         err_msg = "You do not have the necessary permissions for this command."
+    # Slash command checks raise discord.CheckFailure, prefixed commands raise commands.CheckFailure
+    if isinstance(error, (commands.CheckFailure, discord.CheckFailure)):
+         log.warning(f"Permission check failed for '{interaction.command.name}' by {interaction.user}") # Expected, no traceback needed
+         await respond(interaction, "You do not have the necessary permissions for this command.")
+         return
+
+    # Not inside an except block here, so the traceback comes from the error itself
+    log.error(error_message, exc_info=error) # Full traceback for debugging
+
     # Handle InteractionResponded separately if possible
-    elif isinstance(error, discord.InteractionResponded):
-         print("Interaction already responded to, attempting followup for error.")
+    if isinstance(error, discord.InteractionResponded):
+         log.warning("Interaction already responded to, attempting followup for error.")
          err_msg = "Something went wrong, and I might have already responded."
-         try:
-             await interaction.followup.send(err_msg, ephemeral=True)
-         except Exception as followup_e:
-             print(f"Failed to send followup error message: {followup_e}")
-         return # Stop further processing for this specific error
     else:
          err_msg = "Sorry, something went wrong processing that command."
 
-    if interaction.response.is_done():
-        # Use followup if already responded or deferred
-        try:
-            await interaction.followup.send(err_msg, ephemeral=True)
-        except Exception as followup_e:
-             print(f"Failed to send followup error message after check: {followup_e}")
-    else:
-        # Use send_message if not responded yet
-        try:
-            await interaction.response.send_message(err_msg, ephemeral=True)
-        except discord.InteractionResponded: # Catch race condition
-             print("Interaction responded before error message could be sent, attempting followup.")
-             try:
-                 await interaction.followup.send(err_msg, ephemeral=True)
-             except Exception as followup_e:
-                 print(f"Failed to send followup error message after race condition: {followup_e}")
-        except Exception as send_e:
-             print(f"Further error sending initial error response: {send_e}")
+    # Followup if already responded or deferred, initial response otherwise
+    await respond(interaction, err_msg)
 
 
 # --- Run the Bot ---
 if __name__ == "__main__":
-    print("Attempting to start bot...")
+    log.info("Attempting to start bot...")
+    _checkpoints = load_checkpoints()
+    _sent_index_since, _sent_messages = load_sent_messages()
+    save_sent_messages() # Marks the file unclean until the shutdown save, so a crash is detected on the next start
+    # Eager tasks run their first step immediately instead of waiting for the next loop iteration (Python 3.12+).
+    # Set on bot.loop since that's the loop bot.run() drives.
+    if hasattr(asyncio, "eager_task_factory"):
+        bot.loop.set_task_factory(asyncio.eager_task_factory)
     try:
         bot.run(DISCORD_TOKEN)
     except discord.errors.LoginFailure: # Use specific error type for your library (discord.py or py-cord)
-        print("CRITICAL ERROR: Invalid bot token provided.")
+        log.critical("Invalid bot token provided.")
     except discord.errors.PrivilegedIntentsRequired as e: # Use specific error type for your library
-        print(f"CRITICAL ERROR: Missing required privileged intents: {e}")
+        log.critical(f"Missing required privileged intents: {e}")
     except Exception as e:
-        print(f"CRITICAL ERROR during bot startup or runtime: {e}")
-        import traceback
-        traceback.print_exc()
+        log.critical(f"Error during bot startup or runtime: {e}", exc_info=True)
     finally:
         # This runs when bot.run() finishes (e.g., after bot.close())
-        print("Bot process has concluded.")
\ No newline at end of file
+        save_checkpoints(_checkpoints) # In case the save after an interrupted run didn't get to finish
+        save_sent_messages(clean=True)
+        log.info("Bot process has concluded.")
+        _log_listener.stop() # Flushes anything still queued
\ No newline at end of file